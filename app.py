@@ -1,47 +1,529 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for, make_response
+from flask import Flask, request, jsonify, render_template, redirect, url_for, make_response, Response, stream_with_context
+from flask.json.provider import JSONProvider
 from flask_pymongo import PyMongo
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+from werkzeug.middleware.proxy_fix import ProxyFix
 import jwt
 from datetime import datetime, timedelta
 from functools import wraps
 import os
 import logging
+import multiprocessing
+import itertools
+import threading
+import time
+import base64
+import hashlib
+import hmac
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from cachetools import TTLCache
+from pybloomfilter import BloomFilter
+import msgpack
+import orjson
+import redis
+from bson.codec_options import TypeDecoder, TypeRegistry
 from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.monitoring import ConnectionPoolListener
 from dotenv import load_dotenv
+import passwords
+from passwords import password_needs_rehash
 
 # Load environment variables
 load_dotenv()
 
+IS_PROD = os.environ.get('FLASK_ENV') == 'production'
+
 # Configure logging for production
-if os.environ.get('FLASK_ENV') == 'production':
+if IS_PROD:
     logging.basicConfig(level=logging.INFO)
 else:
     logging.basicConfig(level=logging.DEBUG)
 
+def _bson_default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+# Treat naive datetimes (as stored by utcnow()) as UTC when serializing
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC
+
+def dump_json(obj):
+    return orjson.dumps(obj, default=_bson_default, option=ORJSON_OPTIONS)
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider that serializes with orjson and understands ObjectId"""
+    
+    def dumps(self, obj, **kwargs):
+        return dump_json(obj).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dump_json(obj), mimetype='application/json')
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 # Configuration
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')
 if not app.config['SECRET_KEY']:
-    if os.environ.get('FLASK_ENV') == 'production':
+    if IS_PROD:
         raise ValueError("SECRET_KEY environment variable is required in production")
     app.config['SECRET_KEY'] = 'dev-key-only'
 
 app.config['MONGO_URI'] = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/secure_notes')
+# Request threads per process; gunicorn.conf.py reads the same variable
+app.config['WORKER_THREADS'] = int(os.environ.get('GUNICORN_THREADS', 8))
+# Pool bounds are per process: one connection per request thread, plus the note
+# flusher and the database preparation thread
+app.config['MONGO_MAX_POOL_SIZE'] = int(os.environ.get('MONGO_MAX_POOL_SIZE', app.config['WORKER_THREADS'] + 2))
+app.config['MONGO_MIN_POOL_SIZE'] = int(os.environ.get('MONGO_MIN_POOL_SIZE', app.config['WORKER_THREADS']))
 app.config['JWT_EXPIRATION_DELTA'] = timedelta(hours=24)
 
+# JWT signing state, resolved once instead of per request
+_jwt_api = jwt.PyJWT()
+_SECRET = app.config['SECRET_KEY'].encode()
+_ALG = 'HS256'
+_JWT_EXP_SECONDS = int(app.config['JWT_EXPIRATION_DELTA'].total_seconds())
+app.config['REDIS_URL'] = os.environ.get('REDIS_URL')
+app.config['RATELIMIT_STORAGE_URL'] = app.config['REDIS_URL'] or 'memory://'
+# Number of reverse proxies in front of the app that set X-Forwarded-For; 0 trusts none
+app.config['TRUSTED_PROXY_HOPS'] = int(os.environ.get('TRUSTED_PROXY_HOPS', 0))
+
+COOKIE_SECURE = IS_PROD
+
+# Only trust X-Forwarded-For when told a proxy rewrites it; otherwise clients could
+# pick their own address and sidestep the per-IP login limit
+if app.config['TRUSTED_PROXY_HOPS']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXY_HOPS'])
+
+# Rate limiting, shared across workers when Redis is configured. A Redis outage falls
+# back to per-process counters instead of failing the request
+limiter = Limiter(
+    get_remote_address,
+    app=app,
+    storage_uri=app.config['RATELIMIT_STORAGE_URL'],
+    swallow_errors=True,
+    in_memory_fallback_enabled=True
+)
+
+@app.errorhandler(429)
+def rate_limited(e):
+    return jsonify({'error': 'Too many attempts, please try again later'}), 429
+
 # Security headers
+HSTS_HEADERS = {'Strict-Transport-Security': 'max-age=31536000; includeSubDomains'} if IS_PROD else {}
+STATIC_SECURITY_HEADERS = {
+    'X-Content-Type-Options': 'nosniff',
+    'X-Frame-Options': 'DENY',
+    'X-XSS-Protection': '1; mode=block',
+    **HSTS_HEADERS
+}
+
 @app.after_request
 def after_request(response):
-    response.headers['X-Content-Type-Options'] = 'nosniff'
-    response.headers['X-Frame-Options'] = 'DENY'
-    response.headers['X-XSS-Protection'] = '1; mode=block'
-    if os.environ.get('FLASK_ENV') == 'production':
-        response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains'
+    response.headers.update(STATIC_SECURITY_HEADERS)
     return response
 
-# Initialize MongoDB
-mongo = PyMongo(app)
+class PoolStats(ConnectionPoolListener):
+    """Counts open and checked-out MongoDB connections for /health"""
+    
+    def __init__(self):
+        self.open = 0
+        self.in_use = 0
+        self._lock = threading.Lock()
+    
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+    
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+    
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.in_use += 1
+    
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+    
+    def pool_created(self, event):
+        pass
+    
+    def pool_ready(self, event):
+        pass
+    
+    def pool_cleared(self, event):
+        pass
+    
+    def pool_closed(self, event):
+        pass
+    
+    def connection_ready(self, event):
+        pass
+    
+    def connection_check_out_started(self, event):
+        pass
+    
+    def connection_check_out_failed(self, event):
+        pass
+    
+    def snapshot(self):
+        return {
+            'max_size': app.config['MONGO_MAX_POOL_SIZE'],
+            'min_size': app.config['MONGO_MIN_POOL_SIZE'],
+            'open': self.open,
+            'in_use': self.in_use
+        }
+
+pool_stats = PoolStats()
+
+# Initialize MongoDB. minPoolSize keeps warm connections open in the background;
+# zstd (falling back to zlib) compresses note content on the wire. connect=False
+# defers all I/O until first use so the client is safe to create before fork
+mongo = PyMongo(
+    app,
+    connect=False,
+    maxPoolSize=app.config['MONGO_MAX_POOL_SIZE'],
+    minPoolSize=app.config['MONGO_MIN_POOL_SIZE'],
+    compressors='zstd,zlib',
+    retryWrites=True,
+    event_listeners=[pool_stats]
+)
+mongo_users = mongo.db.users
+mongo_notes = mongo.db.notes
+
+class ObjectIdStrDecoder(TypeDecoder):
+    """Decode BSON ObjectIds straight to hex strings for JSON-bound reads"""
+    bson_type = ObjectId
+    
+    def transform_bson(self, value):
+        return str(value)
+
+# Read-only view of notes whose ObjectIds come back as str
+mongo_notes_str_ids = mongo_notes.with_options(codec_options=mongo_notes.codec_options.with_options(
+    type_registry=TypeRegistry([ObjectIdStrDecoder()])
+))
+
+# Usernames known to exist. Once loaded, a miss means no lookup is needed; a hit (or a
+# false positive) is confirmed with a real lookup before spending time on hashing
+username_bloom = BloomFilter(1000000, 0.001)
+
+def load_username_bloom():
+    for user in mongo_users.find({}, {'_id': 0, 'username': 1}):
+        username_bloom.add(user['username'])
+
+# Optional Redis token store shared by all workers: tok:<token> -> user metadata.
+# One connection per request thread; a thread that finds them all busy waits briefly
+# instead of failing (which would silently skip the cache)
+REDIS_POOL_TIMEOUT = 1  # seconds
+
+redis_client = None
+if app.config['REDIS_URL']:
+    redis_client = redis.Redis(connection_pool=redis.BlockingConnectionPool.from_url(
+        app.config['REDIS_URL'],
+        max_connections=app.config['WORKER_THREADS'],
+        timeout=REDIS_POOL_TIMEOUT
+    ))
+
+def _store_session(token, user, exp):
+    if not redis_client:
+        return
+    try:
+        redis_client.setex(f'tok:{token}', _JWT_EXP_SECONDS, msgpack.packb({
+            'user_id': str(user['_id']),
+            'username': user['username'],
+            'exp': exp
+        }))
+    except redis.RedisError as e:
+        app.logger.warning(f'Redis session store failed: {str(e)}')
+
+def _load_session(token):
+    if not redis_client:
+        return None
+    try:
+        raw = redis_client.get(f'tok:{token}')
+    except redis.RedisError as e:
+        app.logger.warning(f'Redis session lookup failed: {str(e)}')
+        return None
+    return msgpack.unpackb(raw) if raw else None
+
+def _drop_session(token):
+    if not redis_client:
+        return
+    try:
+        redis_client.delete(f'tok:{token}')
+    except redis.RedisError as e:
+        app.logger.warning(f'Redis session delete failed: {str(e)}')
+
+def _b64url_decode(segment):
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+def _fast_jwt_decode(token, secret):
+    """Verify and decode an HS256 token, raising the same errors as jwt.decode"""
+    try:
+        header_b64, payload_b64, sig_b64 = token.split('.')
+        header = orjson.loads(_b64url_decode(header_b64))
+        signature = _b64url_decode(sig_b64)
+    except ValueError:
+        raise jwt.DecodeError('Invalid token')
+    
+    if not isinstance(header, dict) or header.get('alg') != _ALG:
+        raise jwt.InvalidAlgorithmError('The specified alg value is not allowed')
+    
+    expected = hmac.new(secret, f'{header_b64}.{payload_b64}'.encode(), hashlib.sha256).digest()
+    if not hmac.compare_digest(expected, signature):
+        raise jwt.InvalidSignatureError('Signature verification failed')
+    
+    try:
+        payload = orjson.loads(_b64url_decode(payload_b64))
+    except ValueError:
+        raise jwt.DecodeError('Invalid payload')
+    
+    if not isinstance(payload, dict):
+        raise jwt.DecodeError('Invalid payload')
+    if 'exp' not in payload:
+        raise jwt.MissingRequiredClaimError('exp')
+    if not isinstance(payload['exp'], (int, float)):
+        raise jwt.DecodeError('Expiration Time claim (exp) must be an integer.')
+    if payload['exp'] <= time.time():
+        raise jwt.ExpiredSignatureError('Signature has expired')
+    return payload
+
+# Decoded JWT cache: token -> (user_id, exp timestamp), or _REJECTED_TOKEN for tokens
+# that failed verification (an invalid or expired token never becomes valid)
+_token_cache = TTLCache(maxsize=10000, ttl=900)
+_token_cache_lock = threading.Lock()
+_REJECTED_TOKEN = (None, 0)
+
+def _decode_cached(token):
+    """Return the user_id for a token: process cache, then Redis, then _fast_jwt_decode"""
+    with _token_cache_lock:
+        cached = _token_cache.get(token)
+    if cached is _REJECTED_TOKEN:
+        raise jwt.InvalidTokenError('Token was rejected')
+    if cached and cached[1] > time.time():
+        return cached[0]
+    
+    # Tokens issued by login() are already verified; trust the Redis copy until it expires
+    data = _load_session(token)
+    if not data or data['exp'] <= time.time():
+        try:
+            data = _fast_jwt_decode(token, _SECRET)
+        except jwt.InvalidTokenError:
+            with _token_cache_lock:
+                _token_cache[token] = _REJECTED_TOKEN
+            raise
+    with _token_cache_lock:
+        _token_cache[token] = (data['user_id'], data['exp'])
+    return data['user_id']
+
+# Password hashing is CPU-bound; run it in worker processes so it doesn't hold the GIL.
+# The pool is created on first use in each process, so it is never inherited across fork.
+# Tasks come from the passwords module, so pool processes never import this one
+password_pool_workers = None
+_password_pool = None
+_password_pool_pid = None
+_password_pool_lock = threading.Lock()
+
+def get_password_pool():
+    global _password_pool, _password_pool_pid
+    if _password_pool_pid != os.getpid():
+        with _password_pool_lock:
+            if _password_pool_pid != os.getpid():
+                # forkserver: don't fork this (threaded) process to start hashing workers
+                mp_context = multiprocessing.get_context('forkserver')
+                mp_context.set_forkserver_preload(['passwords'])
+                _password_pool = ProcessPoolExecutor(
+                    max_workers=password_pool_workers or os.cpu_count(),
+                    mp_context=mp_context
+                )
+                _password_pool_pid = os.getpid()
+    return _password_pool
+
+def hash_password(password):
+    return get_password_pool().submit(passwords.hash_password, password).result()
+
+# Recent failed verifications: blake2b(password + hash) -> True. Only failures are
+# cached, so a repeated wrong guess skips the hash while a correct password never does
+_failed_passwords = TTLCache(maxsize=10000, ttl=30)
+_failed_passwords_lock = threading.Lock()
+
+def verify_password(pw_hash, password):
+    key = hashlib.blake2b(password.encode() + pw_hash.encode(), digest_size=16).digest()
+    with _failed_passwords_lock:
+        if key in _failed_passwords:
+            return False
+    
+    valid = get_password_pool().submit(passwords.check_password, pw_hash, password).result()
+    if not valid:
+        with _failed_passwords_lock:
+            _failed_passwords[key] = True
+    return valid
+
+INDEX_RETRY_SECONDS = 30
+
+# Set once the unique username index exists and the bloom filter holds every stored
+# name; until both are set, register() confirms every name with a real lookup
+_username_index_ready = threading.Event()
+_bloom_ready = threading.Event()
+_database_prep_pid = None
+_database_prep_lock = threading.Lock()
+
+def _create_index(collection, keys, **kwargs):
+    """Create an index, retrying while MongoDB is unreachable; returns False if it can never be built"""
+    while True:
+        try:
+            # No-op if the index already exists
+            collection.create_index(keys, background=True, **kwargs)
+            return True
+        except OperationFailure as e:
+            if e.code == 11000:
+                app.logger.error(f'Index {keys} on {collection.name} cannot be built, '
+                                 f'existing documents have duplicate keys: {str(e)}')
+                return False
+            app.logger.error(f'Index creation failed, retrying in {INDEX_RETRY_SECONDS}s: {str(e)}')
+        except Exception as e:
+            app.logger.error(f'Index creation failed, retrying in {INDEX_RETRY_SECONDS}s: {str(e)}')
+        time.sleep(INDEX_RETRY_SECONDS)
+
+def _prepare_database():
+    if _create_index(mongo_users, 'username', unique=True):
+        _username_index_ready.set()
+    # Built even when the username index can't be; it only speeds up the notes list
+    _create_index(mongo_notes, [('user_id', 1), ('updated_at', -1), ('_id', -1)])
+    
+    try:
+        load_username_bloom()
+        _bloom_ready.set()
+    except Exception as e:
+        app.logger.error(f'Username bloom filter load failed: {str(e)}')
+
+def start_database_prep():
+    """Start index creation and the bloom filter load once per process, in the background"""
+    global _database_prep_pid
+    if _database_prep_pid != os.getpid():
+        with _database_prep_lock:
+            if _database_prep_pid != os.getpid():
+                threading.Thread(target=_prepare_database, daemon=True).start()
+                _database_prep_pid = os.getpid()
+
+def init_worker(password_workers=None):
+    """Per-process setup that touches MongoDB or spawns processes; run after fork"""
+    global password_pool_workers
+    
+    # Database preparation runs off the startup path so an unreachable MongoDB
+    # doesn't stop the worker from booting (and /health from reporting 503)
+    start_database_prep()
+    
+    password_pool_workers = password_workers
+    get_password_pool()
+
+# Note write buffer: inserts arriving while another insert is in flight are
+# queued and flushed together with insert_many. Each queued note carries a Future
+# that the flush resolves, so the request only succeeds once its note is written
+NOTE_FLUSH_INTERVAL = 0.05  # seconds
+NOTE_FLUSH_SIZE = 100
+NOTE_WRITE_TIMEOUT = 30  # seconds
+
+_note_buffer = deque()
+_note_buffer_lock = threading.Lock()
+_note_flush_event = threading.Event()
+_note_flusher = None
+_note_insert_in_flight = False
+
+def _flush_notes():
+    with _note_buffer_lock:
+        # Claim each note; ones whose request already gave up (cancelled) are dropped
+        batch = [(note, future) for note, future in _note_buffer if future.set_running_or_notify_cancel()]
+        _note_buffer.clear()
+    if not batch:
+        return
+    
+    try:
+        mongo_notes.insert_many([note for note, _ in batch], ordered=False)
+    except BulkWriteError as e:
+        app.logger.error(f'Note batch insert failed: {str(e)}')
+        # Unordered inserts report failures per document; a write concern error covers them all
+        failed = {err['index'] for err in e.details.get('writeErrors', [])}
+        if e.details.get('writeConcernErrors'):
+            failed = set(range(len(batch)))
+        for i, (_, future) in enumerate(batch):
+            if i in failed:
+                future.set_exception(e)
+            else:
+                future.set_result(None)
+        return
+    except Exception as e:
+        app.logger.error(f'Note batch insert failed: {str(e)}')
+        for _, future in batch:
+            future.set_exception(e)
+        return
+    
+    for _, future in batch:
+        future.set_result(None)
+
+def _note_flush_loop():
+    while True:
+        _note_flush_event.wait(NOTE_FLUSH_INTERVAL)
+        _note_flush_event.clear()
+        _flush_notes()
+
+def _start_note_flusher():
+    global _note_flusher
+    with _note_buffer_lock:
+        if _note_flusher is None:
+            _note_flusher = threading.Thread(target=_note_flush_loop, daemon=True)
+            _note_flusher.start()
+
+def queue_note_insert(note):
+    """Insert a note directly when idle, otherwise batch it; returns once it is written"""
+    global _note_insert_in_flight
+    with _note_buffer_lock:
+        insert_now = not _note_insert_in_flight and not _note_buffer
+        if insert_now:
+            _note_insert_in_flight = True
+        else:
+            future = Future()
+            _note_buffer.append((note, future))
+            buffered = len(_note_buffer)
+    
+    if insert_now:
+        try:
+            mongo_notes.insert_one(note)
+        finally:
+            with _note_buffer_lock:
+                _note_insert_in_flight = False
+        return
+    
+    _start_note_flusher()
+    if buffered >= NOTE_FLUSH_SIZE:
+        _note_flush_event.set()
+    
+    # Raises the insert error (or a timeout) so the view answers 500 instead of 201
+    try:
+        future.result(timeout=NOTE_WRITE_TIMEOUT)
+    except FutureTimeoutError:
+        # Withdraw the note if it hasn't been flushed yet, so it never appears after the 500.
+        # If the flush already claimed it, report how that write ends instead
+        if future.cancel():
+            raise
+        future.result()
+
+def _unauthorized():
+    # API clients get a 401 to handle themselves; browsers are sent to the login page
+    if request.path.startswith('/api/') or request.accept_mimetypes.best == 'application/json':
+        return jsonify({'error': 'unauthorized'}), 401
+    return redirect(url_for('login'))
 
 def token_required(f):
     @wraps(f)
@@ -49,37 +531,57 @@ def token_required(f):
         token = request.cookies.get('token')
         
         if not token:
-            return redirect(url_for('login'))
+            return _unauthorized()
         
         try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user_id = data['user_id']
+            current_user_oid = ObjectId(_decode_cached(token))
         except jwt.ExpiredSignatureError:
-            return redirect(url_for('login'))
-        except jwt.InvalidTokenError:
-            return redirect(url_for('login'))
+            return _unauthorized()
+        except (jwt.InvalidTokenError, InvalidId):
+            return _unauthorized()
         
-        return f(current_user_id, *args, **kwargs)
+        return f(current_user_oid, *args, **kwargs)
     
     return decorated
 
+# Cached database ping shared by all health probes
+HEALTH_CACHE_SECONDS = 2
+_health = {'ts': 0, 'ok': False}
+_health_lock = threading.Lock()
+
+def _database_healthy():
+    if time.time() - _health['ts'] < HEALTH_CACHE_SECONDS:
+        return _health['ok']
+    
+    with _health_lock:
+        # Another probe may have refreshed while we waited for the lock
+        if time.time() - _health['ts'] >= HEALTH_CACHE_SECONDS:
+            try:
+                mongo.db.command('ping')
+                _health['ok'] = True
+            except Exception as e:
+                app.logger.error(f'Health check failed: {str(e)}')
+                _health['ok'] = False
+            _health['ts'] = time.time()
+        return _health['ok']
+
 @app.route('/health')
 def health_check():
     """Health check endpoint for load balancers"""
-    try:
-        # Test database connection
-        mongo.db.command('ping')
-        return jsonify({'status': 'healthy', 'timestamp': datetime.utcnow().isoformat()}), 200
-    except Exception as e:
-        app.logger.error(f'Health check failed: {str(e)}')
-        return jsonify({'status': 'unhealthy', 'error': 'Database connection failed'}), 503
+    if _database_healthy():
+        return jsonify({
+            'status': 'healthy',
+            'timestamp': datetime.utcnow().isoformat(),
+            'pool': pool_stats.snapshot()
+        }), 200
+    return jsonify({'status': 'unhealthy', 'error': 'Database connection failed'}), 503
 
 @app.route('/')
 def index():
     token = request.cookies.get('token')
     if token:
         try:
-            jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+            _decode_cached(token)
             return redirect(url_for('dashboard'))
         except:
             pass
@@ -103,17 +605,28 @@ def register():
             if len(password) < 6:
                 return jsonify({'error': 'Password must be at least 6 characters'}), 400
             
-            # Check if user exists
-            if mongo.db.users.find_one({'username': username}):
+            # Processes that never ran init_worker() (flask run, gunicorn without -c) start here
+            start_database_prep()
+            
+            # A bloom miss only proves the name is free once the filter is loaded and the
+            # unique index catches names registered by other workers
+            screened = _username_index_ready.is_set() and _bloom_ready.is_set()
+            if (not screened or username in username_bloom) and \
+                    mongo_users.find_one({'username': username}, {'_id': 1}):
                 return jsonify({'error': 'Username already exists'}), 400
             
-            # Create user
-            hashed_password = generate_password_hash(password)
-            user_id = mongo.db.users.insert_one({
-                'username': username,
-                'password': hashed_password,
-                'created_at': datetime.utcnow()
-            }).inserted_id
+            # Create user (the unique index still rejects names this worker hasn't seen)
+            hashed_password = hash_password(password)
+            try:
+                mongo_users.insert_one({
+                    'username': username,
+                    'password': hashed_password,
+                    'created_at': datetime.utcnow()
+                })
+            except DuplicateKeyError:
+                username_bloom.add(username)
+                return jsonify({'error': 'Username already exists'}), 400
+            username_bloom.add(username)
             
             app.logger.info(f'New user registered: {username}')
             return jsonify({'message': 'User created successfully'}), 201
@@ -125,6 +638,7 @@ def register():
     return render_template('register.html')
 
 @app.route('/login', methods=['GET', 'POST'])
+@limiter.limit('10 per minute', methods=['POST'])
 def login():
     if request.method == 'POST':
         try:
@@ -135,21 +649,30 @@ def login():
             if not username or not password:
                 return jsonify({'error': 'Username and password required'}), 400
             
-            user = mongo.db.users.find_one({'username': username})
+            user = mongo_users.find_one({'username': username})
             
-            if user and check_password_hash(user['password'], password):
+            if user and verify_password(user['password'], password):
+                # Upgrade legacy or outdated hashes now that the plain password is known
+                if password_needs_rehash(user['password']):
+                    mongo_users.update_one(
+                        {'_id': user['_id']},
+                        {'$set': {'password': hash_password(password)}}
+                    )
+                
                 # Generate JWT token
-                token = jwt.encode({
+                exp = int(time.time()) + _JWT_EXP_SECONDS
+                token = _jwt_api.encode({
                     'user_id': str(user['_id']),
-                    'exp': datetime.utcnow() + app.config['JWT_EXPIRATION_DELTA']
-                }, app.config['SECRET_KEY'], algorithm='HS256')
+                    'exp': exp
+                }, _SECRET, algorithm=_ALG)
+                _store_session(token, user, exp)
                 
                 response = make_response(jsonify({'message': 'Login successful'}))
                 response.set_cookie('token', token, 
                                   httponly=True, 
-                                  secure=True if os.environ.get('FLASK_ENV') == 'production' else False,
+                                  secure=COOKIE_SECURE,
                                   samesite='Lax',
-                                  max_age=86400)  # 24 hours
+                                  max_age=_JWT_EXP_SECONDS)
                 
                 app.logger.info(f'User logged in: {username}')
                 return response
@@ -165,18 +688,41 @@ def login():
 
 @app.route('/logout')
 def logout():
+    token = request.cookies.get('token')
+    if token:
+        _drop_session(token)
+        with _token_cache_lock:
+            _token_cache.pop(token, None)
+    
     response = make_response(redirect(url_for('login')))
     response.set_cookie('token', '', expires=0)
     return response
 
 @app.route('/dashboard')
 @token_required
-def dashboard(current_user_id):
+def dashboard(current_user_oid):
     return render_template('dashboard.html')
 
+NOTES_CACHE_CONTROL = 'private, max-age=10'
+NOTE_PREVIEW_LENGTH = 150  # characters of content shown in the list view
+
+def bump_notes_deleted(user_oid):
+    """Count a delete on the user, since deletes don't show up in the newest-note probe"""
+    mongo_users.update_one({'_id': user_oid}, {'$inc': {'notes_deleted': 1}})
+
+def notes_etag_state(user_oid):
+    """Newest (updated_at, _id) from the notes index plus the per-user delete counter"""
+    newest = next(mongo_notes.find(
+        {'user_id': user_oid},
+        {'_id': 1, 'updated_at': 1}
+    ).sort([('updated_at', -1), ('_id', -1)]).limit(1), None)
+    user = mongo_users.find_one({'_id': user_oid}, {'_id': 0, 'notes_deleted': 1})
+    newest_key = f'{newest["updated_at"].isoformat()}:{newest["_id"]}' if newest else None
+    return f'{newest_key}:{(user or {}).get("notes_deleted", 0)}'
+
 @app.route('/api/notes', methods=['GET', 'POST'])
 @token_required
-def notes(current_user_id):
+def notes(current_user_oid):
     try:
         if request.method == 'POST':
             data = request.get_json()
@@ -196,51 +742,126 @@ def notes(current_user_id):
             if len(title) > 200:
                 return jsonify({'error': 'Title too long (max 200 characters)'}), 400
             
-            note_id = mongo.db.notes.insert_one({
-                'user_id': ObjectId(current_user_id),
+            # Generate the id up front so batched inserts don't need to report it back
+            note_id = ObjectId()
+            now = datetime.utcnow()
+            queue_note_insert({
+                '_id': note_id,
+                'user_id': current_user_oid,
                 'title': title,
                 'content': content,
-                'created_at': datetime.utcnow(),
-                'updated_at': datetime.utcnow()
-            }).inserted_id
+                'created_at': now,
+                'updated_at': now
+            })
             
             return jsonify({'message': 'Note created', 'note_id': str(note_id)}), 201
         
-        # GET notes with pagination
-        page = request.args.get('page', 1, type=int)
-        per_page = min(request.args.get('per_page', 20, type=int), 100)  # Max 100 per page
+        # GET notes with keyset pagination on (updated_at, _id)
+        per_page = max(1, min(request.args.get('per_page', 20, type=int), 100))  # 1-100 per page
+        after_updated_at = request.args.get('after_updated_at')
+        after_id = request.args.get('after_id')
+        
+        query = {'user_id': current_user_oid}
+        if after_updated_at and after_id:
+            try:
+                after_dt = datetime.fromisoformat(after_updated_at)
+                after_oid = ObjectId(after_id)
+            except (ValueError, InvalidId):
+                return jsonify({'error': 'Invalid cursor'}), 400
+            query['$or'] = [
+                {'updated_at': {'$lt': after_dt}},
+                {'updated_at': after_dt, '_id': {'$lt': after_oid}}
+            ]
         
-        notes = list(mongo.db.notes.find(
-            {'user_id': ObjectId(current_user_id)},
-            {'_id': 1, 'title': 1, 'content': 1, 'created_at': 1, 'updated_at': 1}
-        ).sort('updated_at', -1).skip((page - 1) * per_page).limit(per_page))
+        # Creates and updates move the newest note; deletes bump the user's counter
+        etag = hashlib.blake2b(
+            f'{current_user_oid}:{notes_etag_state(current_user_oid)}:{after_updated_at}:{after_id}:{per_page}'.encode(),
+            digest_size=16
+        ).hexdigest()
         
-        # Convert ObjectId to string
-        for note in notes:
-            note['_id'] = str(note['_id'])
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = NOTES_CACHE_CONTROL
+            return response
+        
+        # The list view only needs a preview; full content is fetched per note via /content
+        cursor = mongo_notes_str_ids.find(
+            query,
+            {
+                '_id': 1, 'title': 1, 'created_at': 1, 'updated_at': 1,
+                'preview': {'$substrCP': ['$content', 0, NOTE_PREVIEW_LENGTH]},
+                'preview_truncated': {'$gt': [{'$strLenCP': '$content'}, NOTE_PREVIEW_LENGTH]}
+            }
+        ).sort([('updated_at', -1), ('_id', -1)]).limit(per_page)
+        
+        # Pull the first batch here so query errors still get the 500 below
+        first = next(cursor, None)
+        
+        def generate():
+            # Emit the JSON array one note at a time as the cursor is consumed
+            yield b'{"notes":['
+            count = 0
+            last = None
+            try:
+                for note in itertools.chain([first] if first else [], cursor):
+                    if count:
+                        yield b','
+                    last = note
+                    yield dump_json(note)
+                    count += 1
+            except Exception as e:
+                # Headers are already sent; close the document and flag the failure
+                app.logger.error(f'Notes API error: {str(e)}')
+                yield b'],"next_cursor":null,"error":"Operation failed"}'
+                return
+            
+            next_cursor = None
+            if count == per_page and last is not None:
+                next_cursor = {
+                    'after_updated_at': last['updated_at'].isoformat(),
+                    'after_id': last['_id']
+                }
+            yield b'],"next_cursor":' + dump_json(next_cursor) + b'}'
         
-        return jsonify(notes)
+        response = Response(stream_with_context(generate()), mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = NOTES_CACHE_CONTROL
+        return response
         
     except Exception as e:
         app.logger.error(f'Notes API error: {str(e)}')
         return jsonify({'error': 'Operation failed'}), 500
 
-@app.route('/api/notes/<note_id>', methods=['PUT', 'DELETE'])
+@app.route('/api/notes/<note_id>/content')
 @token_required
-def note_detail(current_user_id, note_id):
+def note_content(current_user_oid, note_id):
     try:
         note_obj_id = ObjectId(note_id)
     except:
         return jsonify({'error': 'Invalid note ID'}), 400
     
-    note = mongo.db.notes.find_one({
-        '_id': note_obj_id,
-        'user_id': ObjectId(current_user_id)
-    })
+    note = mongo_notes.find_one(
+        {'_id': note_obj_id, 'user_id': current_user_oid},
+        {'_id': 0, 'content': 1}
+    )
     
     if not note:
         return jsonify({'error': 'Note not found'}), 404
     
+    return jsonify({'_id': note_id, 'content': note['content']})
+
+@app.route('/api/notes/<note_id>', methods=['PUT', 'DELETE'])
+@token_required
+def note_detail(current_user_oid, note_id):
+    try:
+        note_obj_id = ObjectId(note_id)
+    except:
+        return jsonify({'error': 'Invalid note ID'}), 400
+    
+    # The user_id filter authorizes the write in the same round trip
+    note_filter = {'_id': note_obj_id, 'user_id': current_user_oid}
+    
     if request.method == 'PUT':
         data = request.get_json()
         update_data = {
@@ -252,18 +873,34 @@ def note_detail(current_user_id, note_id):
         if 'content' in data:
             update_data['content'] = data['content']
         
-        mongo.db.notes.update_one(
-            {'_id': note_obj_id},
-            {'$set': update_data}
+        result = mongo_notes.find_one_and_update(
+            note_filter,
+            {'$set': update_data},
+            projection={'_id': 1},
+            return_document=ReturnDocument.AFTER
         )
         
+        if result is None:
+            return jsonify({'error': 'Note not found'}), 404
+        
         return jsonify({'message': 'Note updated'})
     
     if request.method == 'DELETE':
-        mongo.db.notes.delete_one({'_id': note_obj_id})
+        try:
+            # Counted before the delete: if the delete then fails, the ETag only changes early
+            bump_notes_deleted(current_user_oid)
+            result = mongo_notes.delete_one(note_filter)
+        except Exception as e:
+            app.logger.error(f'Note delete error: {str(e)}')
+            return jsonify({'error': 'Operation failed'}), 500
+        
+        if not result.deleted_count:
+            return jsonify({'error': 'Note not found'}), 404
+        
         return jsonify({'message': 'Note deleted'})
 
 if __name__ == '__main__':
-    app.run(debug=os.environ.get('FLASK_ENV') != 'production', 
+    init_worker()
+    app.run(debug=not IS_PROD, 
             host='0.0.0.0', 
             port=int(os.environ.get('PORT', 5000)))
\ No newline at end of file
@@ -166,6 +166,7 @@ SECRET_KEY=$SECRET_KEY
 MONGO_URI=$MONGO_URI
 FLASK_ENV=production
 PORT=5000
+TRUSTED_PROXY_HOPS=1
 EOF
     
     # Secure the environment file
@@ -190,7 +191,7 @@ Group=$APP_NAME
 WorkingDirectory=$APP_DIR
 Environment=PATH=$APP_DIR/venv/bin
 EnvironmentFile=$APP_DIR/.env
-ExecStart=$APP_DIR/venv/bin/gunicorn --bind 127.0.0.1:5000 --workers 4 --timeout 120 wsgi:app
+ExecStart=$APP_DIR/venv/bin/gunicorn -c gunicorn.conf.py --bind 127.0.0.1:5000 wsgi:app
 ExecReload=/bin/kill -s HUP \$MAINPID
 Restart=always
 RestartSec=3
@@ -0,0 +1,20 @@
+"""
+Gunicorn configuration for production deployment
+"""
+import multiprocessing
+import os
+
+# Import the app once in the master; workers share its read-only globals copy-on-write
+preload_app = True
+
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+keepalive = 65
+timeout = 120
+
+def post_fork(server, worker):
+    # MongoDB I/O and the password hashing pool must not be inherited from the master.
+    # Split the cores between workers, but every worker needs at least one hashing process
+    from app import init_worker
+    init_worker(password_workers=max(1, multiprocessing.cpu_count() // server.cfg.workers))
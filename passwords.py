@@ -0,0 +1,25 @@
+"""
+Password hashing helpers run inside the hashing process pool.
+
+Kept free of app imports so pool processes only load argon2 and werkzeug.
+"""
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+
+password_hasher = PasswordHasher(time_cost=2, memory_cost=65536, parallelism=1)
+
+def hash_password(password):
+    return password_hasher.hash(password)
+
+def check_password(pw_hash, password):
+    # Hashes created before the switch to argon2 are werkzeug PBKDF2/scrypt hashes
+    if not pw_hash.startswith('$argon2'):
+        return check_password_hash(pw_hash, password)
+    try:
+        return password_hasher.verify(pw_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+def password_needs_rehash(pw_hash):
+    return not pw_hash.startswith('$argon2') or password_hasher.check_needs_rehash(pw_hash)
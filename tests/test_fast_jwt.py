@@ -0,0 +1,102 @@
+"""
+_fast_jwt_decode must accept and reject exactly the tokens jwt.decode does
+"""
+import base64
+import hashlib
+import hmac
+import time
+import unittest
+
+import jwt
+import orjson
+
+from app import _ALG, _SECRET, _fast_jwt_decode, _jwt_api
+
+HEADER = {'alg': 'HS256', 'typ': 'JWT'}
+
+def b64(raw):
+    if not isinstance(raw, bytes):
+        raw = orjson.dumps(raw)
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+def sign(header_b64, payload_b64, secret=_SECRET):
+    signing_input = f'{header_b64}.{payload_b64}'
+    signature = hmac.new(secret, signing_input.encode(), hashlib.sha256).digest()
+    return f'{signing_input}.{b64(signature)}'
+
+def future_exp():
+    return int(time.time()) + 60
+
+class FastJwtDecodeTest(unittest.TestCase):
+    def assert_rejected_like_pyjwt(self, token, error):
+        with self.assertRaises(error):
+            jwt.decode(token, _SECRET, algorithms=[_ALG], options={'require': ['exp']})
+        with self.assertRaises(error):
+            _fast_jwt_decode(token, _SECRET)
+
+    def test_round_trips_login_token(self):
+        claims = {'user_id': '64b7f0c2a1b2c3d4e5f60718', 'exp': future_exp()}
+        token = _jwt_api.encode(claims, _SECRET, algorithm=_ALG)
+        self.assertEqual(_fast_jwt_decode(token, _SECRET), claims)
+        self.assertEqual(_fast_jwt_decode(token, _SECRET), jwt.decode(token, _SECRET, algorithms=[_ALG]))
+
+    def test_tampered_signature(self):
+        token = _jwt_api.encode({'user_id': 'u', 'exp': future_exp()}, _SECRET, algorithm=_ALG)
+        header_b64, payload_b64, sig_b64 = token.split('.')
+        flipped = 'A' if sig_b64[0] != 'A' else 'B'
+        self.assert_rejected_like_pyjwt(f'{header_b64}.{payload_b64}.{flipped}{sig_b64[1:]}', jwt.InvalidSignatureError)
+
+    def test_tampered_payload(self):
+        token = _jwt_api.encode({'user_id': 'u', 'exp': future_exp()}, _SECRET, algorithm=_ALG)
+        header_b64, _, sig_b64 = token.split('.')
+        forged = b64({'user_id': 'someone-else', 'exp': future_exp()})
+        self.assert_rejected_like_pyjwt(f'{header_b64}.{forged}.{sig_b64}', jwt.InvalidSignatureError)
+
+    def test_wrong_secret(self):
+        token = _jwt_api.encode({'user_id': 'u', 'exp': future_exp()}, b'not-the-secret', algorithm=_ALG)
+        self.assert_rejected_like_pyjwt(token, jwt.InvalidSignatureError)
+
+    def test_alg_none(self):
+        token = f"{b64({'alg': 'none', 'typ': 'JWT'})}.{b64({'user_id': 'u', 'exp': future_exp()})}."
+        self.assert_rejected_like_pyjwt(token, jwt.InvalidAlgorithmError)
+
+    def test_other_algorithm(self):
+        token = jwt.encode({'user_id': 'u', 'exp': future_exp()}, _SECRET, algorithm='HS512')
+        self.assert_rejected_like_pyjwt(token, jwt.InvalidAlgorithmError)
+
+    def test_wrong_segment_count(self):
+        token = _jwt_api.encode({'user_id': 'u', 'exp': future_exp()}, _SECRET, algorithm=_ALG)
+        for bad in ('', token.rsplit('.', 1)[0], f'{token}.extra', token.replace('.', '')):
+            with self.subTest(token=bad):
+                self.assert_rejected_like_pyjwt(bad, jwt.DecodeError)
+
+    def test_bad_base64(self):
+        token = _jwt_api.encode({'user_id': 'u', 'exp': future_exp()}, _SECRET, algorithm=_ALG)
+        header_b64, payload_b64, sig_b64 = token.split('.')
+        for bad in (f'!!!.{payload_b64}.{sig_b64}', f'{header_b64}.{payload_b64}.a', f'é.{payload_b64}.{sig_b64}'):
+            with self.subTest(token=bad):
+                self.assert_rejected_like_pyjwt(bad, jwt.DecodeError)
+
+    def test_bad_json(self):
+        payload_b64 = b64({'user_id': 'u', 'exp': future_exp()})
+        self.assert_rejected_like_pyjwt(sign(b64(b'{nope'), payload_b64), jwt.DecodeError)
+        self.assert_rejected_like_pyjwt(sign(b64(HEADER), b64(b'{nope')), jwt.DecodeError)
+        self.assert_rejected_like_pyjwt(sign(b64(HEADER), b64([1, 2])), jwt.DecodeError)
+
+    def test_missing_exp(self):
+        self.assert_rejected_like_pyjwt(sign(b64(HEADER), b64({'user_id': 'u'})), jwt.MissingRequiredClaimError)
+
+    def test_non_numeric_exp(self):
+        self.assert_rejected_like_pyjwt(sign(b64(HEADER), b64({'user_id': 'u', 'exp': 'soon'})), jwt.DecodeError)
+        # PyJWT lets int() raise TypeError for these; they must still be a token error here
+        for exp in (None, [future_exp()], {'at': future_exp()}):
+            with self.subTest(exp=exp):
+                with self.assertRaises(jwt.DecodeError):
+                    _fast_jwt_decode(sign(b64(HEADER), b64({'user_id': 'u', 'exp': exp})), _SECRET)
+
+    def test_expired(self):
+        token = _jwt_api.encode({'user_id': 'u', 'exp': int(time.time()) - 10}, _SECRET, algorithm=_ALG)
+        self.assert_rejected_like_pyjwt(token, jwt.ExpiredSignatureError)
+
+if __name__ == '__main__':
+    unittest.main()
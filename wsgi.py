@@ -3,8 +3,9 @@
 WSGI entry point for production deployment
 """
 import os
-from app import app
+from app import app, init_worker
 
 if __name__ == "__main__":
+    init_worker()
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port)
\ No newline at end of file